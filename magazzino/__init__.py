@@ -0,0 +1,8 @@
+"""Logica del magazzino utilizzabile senza Streamlit.
+
+I sottomoduli importano pandas solo quando servono; fpdf, openpyxl e la
+connessione Google Sheets vengono caricati al primo utilizzo.
+"""
+from magazzino.config import MESI_COPERTURA, MESI_BUFFER, TARGET_MESI, MIN_SCORTA_CAL
+
+__all__ = ["MESI_COPERTURA", "MESI_BUFFER", "TARGET_MESI", "MIN_SCORTA_CAL"]
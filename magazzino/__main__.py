@@ -0,0 +1,5 @@
+import sys
+
+from magazzino.cli import main
+
+sys.exit(main())
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+from magazzino.config import (
+    DATA_MAI_MODIFICATO, FORMATO_TIMESTAMP, MIN_SCORTA_CAL, TARGET_MESI,
+)
+from magazzino.inventario import get_qty
+
+# --- STATI ---
+STATO_SOTTO_MINIMO = "🔴 SOTTO MINIMO"
+STATO_ESAURITO = "🔴 ESAURITO"
+STATO_DA_ORDINARE = "🟡 DA ORDINARE"
+STATO_OK = "🟢 OK"
+STATI_ORDINE = [STATO_SOTTO_MINIMO, STATO_ESAURITO, STATO_DA_ORDINARE, STATO_OK]
+
+COLONNE_ANAGRAFICA = ['Codice', 'Descrizione', 'Categoria', 'Assay_Name', 'Confezione', 'is_cal', 'is_rgt', 'is_cons']
+COLONNE_RICERCA_ORDINI = ['Descrizione', 'Codice', 'Categoria', 'Assay_Name']
+COLONNE_ORDINI = ['Stato', 'Categoria', 'Assay_Name', 'Descrizione', 'Codice', 'Giacenza', 'Target', 'Days_Left', 'Da_Ordinare']
+COLONNE_VERIFICA = ['Stato_Verifica', 'Codice', 'Descrizione', 'Giacenza', 'Data_Modifica', 'Giorni']
+
+
+# --- ETICHETTE OPERAZIONI ---
+def giacenze(df_master, magazzino):
+    return pd.Series([get_qty(magazzino, c) for c in df_master['Codice']], index=df_master.index)
+
+
+def etichette(df_master, magazzino):
+    return pd.Series([
+        f"{desc}{f' ({assay})' if assay else ''} (Disp: {get_qty(magazzino, cod)})"
+        for cod, desc, assay in zip(df_master['Codice'], df_master['Descrizione'], df_master['Assay_Name'])
+    ], index=df_master.index, dtype=object)
+
+
+# --- ORDINI ---
+def analisi_ordini(df_master, magazzino):
+    giacenza = giacenze(df_master, magazzino)
+    consumo = df_master['Kit_Mese_Numeric']
+    is_cal = df_master['is_cal']
+
+    # astype(str): su un sottoinsieme di righe .str categorico lavorerebbe su tutte le categorie
+    cod_pulito = df_master['Codice'].astype(str).str.upper().str.replace("-", "").str.strip()
+    extra = np.where(cod_pulito.str.contains("4V3730"), 1, np.where(cod_pulito.str.contains("1R1822"), 2, 0))
+    target = np.maximum(np.ceil(consumo * TARGET_MESI).astype(int) + extra, 2)
+    target = np.where(is_cal, np.maximum(target, MIN_SCORTA_CAL), target)
+
+    da_ord = np.maximum(0, target - giacenza)
+    days_left = np.trunc(giacenza / (consumo / 30)).where((consumo > 0) & (giacenza > 0))
+
+    stato = np.select(
+        [is_cal & (giacenza < MIN_SCORTA_CAL), giacenza == 0, da_ord > 0],
+        [STATO_SOTTO_MINIMO, STATO_ESAURITO, STATO_DA_ORDINARE],
+        STATO_OK,
+    )
+
+    return df_master[COLONNE_ANAGRAFICA].assign(
+        Giacenza=giacenza, Stato=stato, Target=target, Da_Ordinare=da_ord, Days_Left=days_left.astype(float)
+    )
+
+
+# --- DA VERIFICARE ---
+def ultima_modifica_dt(um):
+    # Le date "2000-..." indicano articoli mai movimentati: diventano NaT
+    um = um.astype(str)
+    return pd.to_datetime(um.where(~um.str.startswith(DATA_MAI_MODIFICATO[:4])), format=FORMATO_TIMESTAMP, errors='coerce')
+
+
+def gruppo_categoria(df):
+    return pd.Series(np.select([df['is_rgt'], df['is_cal'], df['is_cons']], ["RGT", "CAL", "CONS"], "ALTRO"), index=df.index)
+
+
+def giorni_fermo(um_dt, oggi):
+    # Giorni di calendario dall'ultima modifica; 999 per gli articoli mai movimentati
+    oggi = pd.Timestamp(oggi).normalize()
+    return (oggi - um_dt.dt.normalize()).dt.days.fillna(999).astype(int)
+
+
+def stato_verifica(giacenza):
+    return pd.Series(np.where(giacenza > 0, "🚨 URGENTE", "⚠️ VERIFICA"), index=giacenza.index, dtype=object)
+
+
+# --- STAMPA ---
+def giacenza_positiva(df_master, magazzino):
+    df_print = df_master[['Codice', 'Descrizione', 'Categoria']].assign(Giacenza=giacenze(df_master, magazzino))
+    return df_print[df_print['Giacenza'] > 0]
@@ -0,0 +1,92 @@
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from magazzino.config import MASTER_PATH, MESI_PREAVVISO_SCADENZA
+
+REPORT = ["ordine", "scadenze", "pdf"]
+
+
+def _parser():
+    p = argparse.ArgumentParser(
+        prog="python -m magazzino",
+        description="Genera ordine, report scadenze e PDF giacenza senza interfaccia.",
+    )
+    p.add_argument("report", nargs="*", metavar="{" + ",".join(REPORT) + "}",
+                   help="report da generare (default: tutti)")
+    p.add_argument("--master", default=MASTER_PATH, help="file Excel anagrafica (default: %(default)s)")
+    p.add_argument("--inventario", help="copia locale di Foglio1 (CSV/Excel); se assente legge da Google Sheets")
+    p.add_argument("--out", default=".", help="cartella di destinazione (default: %(default)s)")
+    p.add_argument("--mesi", type=int, default=MESI_PREAVVISO_SCADENZA, help="orizzonte scadenze in mesi (default: %(default)s)")
+    return p
+
+
+def _scrivi(out, nome, dati):
+    path = os.path.join(out, nome)
+    with open(path, "wb") as f:
+        f.write(dati)
+    print(path)
+
+
+def _carica_inventario(path):
+    if path:
+        from magazzino.inventario import leggi_file
+        return leggi_file(path)
+    from magazzino.cloud import connessione, fetch_inventory
+    return fetch_inventory(connessione(), strict=True)
+
+
+def main(argv=None):
+    parser = _parser()
+    args = parser.parse_args(argv)
+    sconosciuti = set(args.report) - set(REPORT)
+    if sconosciuti:
+        parser.error(f"report non validi: {', '.join(sorted(sconosciuti))}")
+    report = args.report or REPORT
+    now = datetime.now()
+
+    from magazzino import analisi, export, scadenze
+    from magazzino.master import load_master_data
+
+    try:
+        df_master = load_master_data(args.master)
+    except Exception as e:
+        print(f"Errore Dati Master: {e}", file=sys.stderr)
+        return 1
+    if df_master.empty:
+        print("Errore Dati Master.", file=sys.stderr)
+        return 1
+    try:
+        magazzino = _carica_inventario(args.inventario)
+    except Exception as e:
+        print(f"Errore lettura inventario: {e}", file=sys.stderr)
+        return 1
+    os.makedirs(args.out, exist_ok=True)
+
+    if "ordine" in report:
+        df_export = export.tabella_ordine(analisi.analisi_ordini(df_master, magazzino))
+        if df_export.empty:
+            print("Nessun ordine necessario.", file=sys.stderr)
+        else:
+            _scrivi(args.out, export.nome_ordine(now), export.excel_bytes(df_export))
+
+    if "scadenze" in report:
+        indice = scadenze.IndiceScadenze.da_magazzino(magazzino)
+        anagrafica = scadenze.anagrafica_da_master(df_master)
+        oggi = scadenze.mese_corrente(now)
+        df_cal_export = scadenze.reintegro_calibratori(indice, anagrafica, oggi, args.mesi)
+        if not df_cal_export.empty:
+            _scrivi(args.out, export.nome_reintegro_cal(now), export.excel_bytes(df_cal_export))
+        df_rgt_exp = scadenze.reagenti_in_scadenza(indice, anagrafica, oggi, args.mesi)
+        if not df_rgt_exp.empty:
+            _scrivi(args.out, export.nome_reagenti_scadenza(now), export.excel_bytes(df_rgt_exp))
+
+    if "pdf" in report:
+        df_print = analisi.giacenza_positiva(df_master, magazzino)
+        if df_print.empty:
+            print("Magazzino vuoto!", file=sys.stderr)
+        else:
+            _scrivi(args.out, export.nome_pdf(now), export.create_pdf_report(df_print))
+
+    return 0
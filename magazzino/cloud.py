@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from magazzino.config import COLONNE_LOG, WORKSHEET_INVENTARIO, WORKSHEET_LOG
+from magazzino.inventario import a_dataframe, da_dataframe
+
+
+def connessione():
+    # Import ritardato: streamlit e st-gsheets-connection servono solo qui
+    import streamlit as st
+    from streamlit_gsheets import GSheetsConnection
+    return st.connection("gsheets", type=GSheetsConnection)
+
+
+def fetch_inventory(conn, strict=False):
+    # strict=True per i job non presidiati: un errore di lettura non deve
+    # diventare un magazzino vuoto
+    try:
+        return da_dataframe(conn.read(worksheet=WORKSHEET_INVENTARIO, ttl=0))
+    except:
+        if strict: raise
+        return {}
+
+
+def update_inventory(conn, magazzino_dict):
+    conn.update(worksheet=WORKSHEET_INVENTARIO, data=a_dataframe(magazzino_dict))
+
+
+def manage_log_cloud(conn, df_log, azione, prodotto_nome, qta):
+    try:
+        now = datetime.now()
+        new_row = {
+            "Timestamp": now,
+            "Data_Leggibile": now.strftime("%d/%m %H:%M"),
+            "Azione": f"{azione} ({qta})",
+            "Prodotto": prodotto_nome
+        }
+
+        if df_log is None or df_log.empty:
+            df_log = pd.DataFrame(columns=COLONNE_LOG)
+
+        df_log = pd.concat([pd.DataFrame([new_row]), df_log], ignore_index=True)
+
+        days_ago_30 = now - timedelta(days=30)
+        df_log['Timestamp'] = pd.to_datetime(df_log['Timestamp'])
+        df_log_clean = df_log[df_log['Timestamp'] > days_ago_30]
+
+        conn.update(worksheet=WORKSHEET_LOG, data=df_log_clean)
+        return df_log_clean
+    except Exception as e:
+        return pd.DataFrame()
+
+
+def fetch_only_log(conn):
+    try:
+        df_log = conn.read(worksheet=WORKSHEET_LOG, ttl=0)
+        if not df_log.empty:
+            df_log['Timestamp'] = pd.to_datetime(df_log['Timestamp'])
+            df_log = df_log.sort_values(by='Timestamp', ascending=False)
+        return df_log
+    except: return pd.DataFrame()
@@ -0,0 +1,19 @@
+# --- PARAMETRI ---
+MESI_COPERTURA = 1.0
+MESI_BUFFER = 0.25
+TARGET_MESI = MESI_COPERTURA + MESI_BUFFER
+MIN_SCORTA_CAL = 3
+
+# --- SCADENZE ---
+MESI_PREAVVISO_SCADENZA = 2
+GIORNI_VERIFICA = 30
+
+# --- FILE E FORMATI ---
+MASTER_PATH = 'dati.xlsx'
+FORMATO_TIMESTAMP = "%Y-%m-%d %H:%M:%S"
+DATA_MAI_MODIFICATO = '2000-01-01 00:00:00'
+
+WORKSHEET_INVENTARIO = "Foglio1"
+WORKSHEET_LOG = "Logs"
+COLONNE_INVENTARIO = ["Codice", "Quantita", "Scadenze_JSON", "Ultima_Modifica"]
+COLONNE_LOG = ["Timestamp", "Data_Leggibile", "Azione", "Prodotto"]
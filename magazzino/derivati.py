@@ -0,0 +1,129 @@
+from collections import Counter
+from datetime import datetime
+from itertools import count
+
+import pandas as pd
+
+from magazzino.analisi import analisi_ordini, etichette, giorni_fermo, gruppo_categoria, stato_verifica, ultima_modifica_dt
+from magazzino.config import DATA_MAI_MODIFICATO, GIORNI_VERIFICA, MESI_PREAVVISO_SCADENZA
+from magazzino.scadenze import IndiceScadenze, anagrafica_da_master, mese_corrente, stato_lotti, tabelle_scadenze
+
+# Versioni uniche anche tra ricostruzioni: le cache delle viste restano valide
+_VERSIONI = count(1)
+
+COLONNE_DERIVATE = [
+    'Label', 'Giacenza', 'Stato', 'Target', 'Da_Ordinare', 'Days_Left', 'Ultima_Modifica', 'Ultima_Modifica_dt',
+    'Data_Modifica', 'Giorni', 'Da_Verificare', 'Stato_Verifica',
+]
+
+
+def calcola_righe(df_rows, magazzino, oggi):
+    df_c = analisi_ordini(df_rows, magazzino)
+    df_c['Label'] = etichette(df_rows, magazzino)
+    df_c['Ultima_Modifica'] = pd.Series(
+        [magazzino.get(c, {}).get('ultima_modifica', DATA_MAI_MODIFICATO) for c in df_rows['Codice']], index=df_rows.index, dtype=object
+    )
+    df_c['Ultima_Modifica_dt'] = ultima_modifica_dt(df_c['Ultima_Modifica'])
+    df_c['Data_Modifica'] = df_c['Ultima_Modifica'].str[:10]
+    df_c['Stato_Verifica'] = stato_verifica(df_c['Giacenza'])
+    return _giorni(df_c, oggi)
+
+
+def _giorni(df_c, oggi):
+    df_c['Giorni'] = giorni_fermo(df_c['Ultima_Modifica_dt'], oggi)
+    df_c['Da_Verificare'] = df_c['Giorni'] >= GIORNI_VERIFICA
+    return df_c
+
+
+def _conta_verifica(righe):
+    return Counter(righe.loc[righe['Da_Verificare'], 'Gruppo'])
+
+
+def _sostituisci_lotti(df, nuove, codici):
+    return pd.concat([df[~df['Codice Prodotto'].isin(codici)], nuove], ignore_index=True)
+
+
+class TabellaDerivata:
+    # Tabella per articolo (etichette, giacenza, stato ordine, giorni senza
+    # movimenti) e tabelle dei lotti mantenute tra i rerun. I movimenti segnano
+    # i codici come "sporchi" e aggiorna() ricalcola solo quelle righe; il
+    # cambio di data (giorni fermi) o di orizzonte (stato lotti) ricalcola
+    # una sola colonna.
+
+    def __init__(self, df_master, magazzino):
+        self.master = df_master
+        self.magazzino = magazzino
+        self.sporchi = set()
+        self.ricostruisci()
+
+    def ricostruisci(self, now=None):
+        self.oggi = (now or datetime.now()).date()
+        self.tabella = calcola_righe(self.master, self.magazzino, self.oggi)
+        self.tabella['Gruppo'] = gruppo_categoria(self.tabella)
+        self.n_verifica = _conta_verifica(self.tabella)
+        self._righe = {}
+        for idx, cod in self.tabella['Codice'].items():
+            self._righe.setdefault(cod, []).append(idx)
+
+        self.anagrafica = anagrafica_da_master(self.master)
+        self.indice = IndiceScadenze.da_magazzino(self.magazzino)
+        self.orizzonte = (mese_corrente(now), MESI_PREAVVISO_SCADENZA)
+        self.lotti_cal, self.lotti_rgt = tabelle_scadenze(self.indice, self.anagrafica, *self.orizzonte)
+
+        self.sporchi.clear()
+        self.versione = self.versione_lotti = next(_VERSIONI)
+
+    def valida_per(self, df_master, magazzino):
+        return self.master is df_master and self.magazzino is magazzino
+
+    def segna(self, *codici):
+        self.sporchi.update(codici)
+
+    def aggiorna(self, now=None):
+        oggi = (now or datetime.now()).date()
+        if oggi != self.oggi:
+            # Cambio data: cambiano solo i giorni fermi, per tutte le righe
+            self.oggi = oggi
+            _giorni(self.tabella, oggi)
+            self.n_verifica = _conta_verifica(self.tabella)
+            self.versione = next(_VERSIONI)
+        if not self.sporchi:
+            return
+
+        idx = [i for cod in self.sporchi for i in self._righe.get(cod, [])]
+        if idx:
+            self.n_verifica -= _conta_verifica(self.tabella.loc[idx])
+            nuove = calcola_righe(self.master.loc[idx], self.magazzino, oggi)
+            for col in COLONNE_DERIVATE:
+                self.tabella.loc[idx, col] = nuove[col]
+            self.n_verifica += _conta_verifica(self.tabella.loc[idx])
+
+        cambiati = []
+        for cod in self.sporchi:
+            prima = self.indice.lotti(cod)
+            self.indice.aggiorna(cod, self.magazzino.get(cod, {}).get('scadenze', []))
+            if self.indice.lotti(cod) != prima:
+                cambiati.append(cod)
+        if cambiati:
+            cal, rgt = tabelle_scadenze(self.indice, self.anagrafica, *self.orizzonte, codici=cambiati)
+            self.lotti_cal = _sostituisci_lotti(self.lotti_cal, cal, cambiati)
+            self.lotti_rgt = _sostituisci_lotti(self.lotti_rgt, rgt, cambiati)
+            self.versione_lotti = next(_VERSIONI)
+
+        self.sporchi.clear()
+        self.versione = next(_VERSIONI)
+
+    # --- VISTE ---
+    def riga(self, label):
+        return self.tabella[self.tabella['Label'] == label].iloc[0]
+
+    def scadenze(self, oggi=None, mesi=MESI_PREAVVISO_SCADENZA):
+        # Tabelle lotti (calibratori, reagenti); lo stato si ricalcola solo
+        # se cambiano mese corrente o orizzonte
+        oggi = oggi if oggi is not None else mese_corrente()
+        if (oggi, mesi) != self.orizzonte:
+            self.orizzonte = (oggi, mesi)
+            for df in (self.lotti_cal, self.lotti_rgt):
+                df['Stato'] = stato_lotti(df['Mese'], oggi, mesi)
+            self.versione_lotti = next(_VERSIONI)
+        return self.lotti_cal, self.lotti_rgt
@@ -0,0 +1,98 @@
+import io
+from datetime import datetime
+
+import pandas as pd
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+MIME_PDF = "application/pdf"
+
+
+# --- NOMI FILE ---
+def nome_ordine(now=None):
+    return f"ordine_abbott_{(now or datetime.now()).strftime('%Y-%m-%d')}.xlsx"
+
+
+def nome_reintegro_cal(now=None):
+    return f"reintegro_calibratori_{(now or datetime.now()).strftime('%Y%m%d')}.xlsx"
+
+
+def nome_reagenti_scadenza(now=None):
+    return f"reagenti_in_scadenza_{(now or datetime.now()).strftime('%Y%m%d')}.xlsx"
+
+
+def nome_pdf(now=None):
+    return f"inventario_{(now or datetime.now()).strftime('%Y%m%d')}.pdf"
+
+
+# --- EXCEL ---
+def excel_bytes(df):
+    # openpyxl viene caricato da pandas solo qui
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False)
+    return buffer.getvalue()
+
+
+def tabella_ordine(df_c):
+    df_export = df_c[df_c['Da_Ordinare'] > 0]
+
+    cols_to_export = ['Codice', 'Categoria', 'Descrizione', 'Da_Ordinare']
+    if 'Confezione' in df_export.columns:
+        cols_to_export.append('Confezione')
+
+    rename_map = {
+        'Codice': 'Codice Prodotto',
+        'Categoria': 'Tipo',
+        'Da_Ordinare': 'Qta Ordine',
+        'Confezione': 'Conf.to'
+    }
+    return df_export[cols_to_export].rename(columns=rename_map)
+
+
+# --- PDF ---
+def _pdf_class():
+    from fpdf import FPDF
+
+    class PDF(FPDF):
+        def header(self):
+            self.set_font('Arial', 'B', 15)
+            self.cell(0, 10, f'Inventario Magazzino - {datetime.now().strftime("%d/%m/%Y")}', 0, 1, 'C')
+            self.ln(5)
+        def footer(self):
+            self.set_y(-15)
+            self.set_font('Arial', 'I', 8)
+            self.cell(0, 10, f'Pagina {self.page_no()}', 0, 0, 'C')
+
+    return PDF
+
+
+def create_pdf_report(df_data):
+    pdf = _pdf_class()()
+    pdf.add_page()
+    pdf.set_font('Arial', '', 10)
+    categorie = sorted(df_data['Categoria'].unique().astype(str))
+    for cat in categorie:
+        pdf.set_fill_color(200, 220, 255)
+        pdf.set_font('Arial', 'B', 12)
+        cat_clean = cat.encode('latin-1', 'replace').decode('latin-1')
+        pdf.cell(0, 10, f"CATEGORIA: {cat_clean}", 1, 1, 'L', fill=True)
+
+        subset = df_data[df_data['Categoria'] == cat].sort_values(by='Descrizione')
+
+        pdf.set_font('Arial', 'B', 9)
+        pdf.cell(30, 8, "Codice", 1)
+        pdf.cell(130, 8, "Prodotto", 1)
+        pdf.cell(30, 8, "Giacenza", 1)
+        pdf.ln()
+
+        pdf.set_font('Arial', '', 9)
+        for _, row in subset.iterrows():
+            nome = str(row['Descrizione'])[:75].encode('latin-1', 'replace').decode('latin-1')
+            cod = str(row['Codice']).encode('latin-1', 'replace').decode('latin-1')
+            qta = str(int(row['Giacenza']))
+            pdf.cell(30, 7, cod, 1)
+            pdf.cell(130, 7, nome, 1)
+            pdf.cell(30, 7, qta, 1)
+            pdf.ln()
+        pdf.ln(5)
+    return pdf.output(dest='S').encode('latin-1')
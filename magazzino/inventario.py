@@ -0,0 +1,134 @@
+import json
+from datetime import datetime
+
+import pandas as pd
+
+from magazzino.config import COLONNE_INVENTARIO, DATA_MAI_MODIFICATO, FORMATO_TIMESTAMP
+
+
+class QuantitaInsufficiente(ValueError):
+    pass
+
+
+def nuovo_articolo():
+    return {'qty': 0, 'scadenze': [], 'ultima_modifica': DATA_MAI_MODIFICATO}
+
+
+def get_qty(magazzino, cod):
+    return magazzino.get(cod, {}).get('qty', 0)
+
+
+# --- CONVERSIONE DA/VERSO IL FOGLIO ---
+def da_dataframe(df_db):
+    magazzino = {}
+    if not df_db.empty and 'Codice' in df_db.columns:
+        df_db = df_db.copy()
+        df_db['Codice'] = df_db['Codice'].astype(str)
+        for _, row in df_db.iterrows():
+            cod = str(row['Codice'])
+            qty = row['Quantita']
+            try: scadenze = json.loads(row['Scadenze_JSON'])
+            except: scadenze = []
+
+            if 'Ultima_Modifica' in df_db.columns:
+                um = str(row['Ultima_Modifica'])
+                if um == 'nan' or not um.strip(): um = DATA_MAI_MODIFICATO
+            else:
+                um = DATA_MAI_MODIFICATO
+
+            magazzino[cod] = {'qty': qty, 'scadenze': scadenze, 'ultima_modifica': um}
+    return magazzino
+
+
+def a_dataframe(magazzino):
+    data_list = []
+    for cod, info in magazzino.items():
+        if info['qty'] > 0:
+            um = info.get('ultima_modifica', DATA_MAI_MODIFICATO)
+            data_list.append({
+                "Codice": cod,
+                "Quantita": info['qty'],
+                "Scadenze_JSON": json.dumps(info['scadenze']),
+                "Ultima_Modifica": um
+            })
+
+    if not data_list:
+        return pd.DataFrame(columns=COLONNE_INVENTARIO)
+    return pd.DataFrame(data_list)
+
+
+def leggi_file(path):
+    # Copia locale di "Foglio1" (CSV o Excel), utile per i job schedulati
+    if str(path).lower().endswith('.csv'):
+        df_db = pd.read_csv(path, dtype={'Codice': str})
+    else:
+        df_db = pd.read_excel(path, engine='openpyxl', dtype={'Codice': str})
+    return da_dataframe(df_db)
+
+
+# --- MOVIMENTI ---
+def _consuma_fifo(scadenze, qty):
+    rem = qty
+    new_scad = []
+    for batch in scadenze:
+        if rem > 0:
+            if batch['qty'] > rem:
+                batch['qty'] -= rem
+                rem = 0
+                new_scad.append(batch)
+            else: rem -= batch['qty']
+        else: new_scad.append(batch)
+    return new_scad
+
+
+def _tocca(ref, now=None):
+    ref['ultima_modifica'] = (now or datetime.now()).strftime(FORMATO_TIMESTAMP)
+
+
+def articolo(magazzino, cod):
+    if cod not in magazzino:
+        magazzino[cod] = nuovo_articolo()
+    return magazzino[cod]
+
+
+def carico(magazzino, cod, qty, scad_display, scad_sort, now=None):
+    ref = articolo(magazzino, cod)
+    ref['qty'] += qty
+    ref['scadenze'].append({'display': scad_display, 'sort': scad_sort, 'qty': qty})
+    ref['scadenze'].sort(key=lambda x: x['sort'])
+    _tocca(ref, now)
+    return "Carico"
+
+
+def prelievo(magazzino, cod, qty, now=None):
+    ref = articolo(magazzino, cod)
+    if ref['qty'] < qty:
+        raise QuantitaInsufficiente(f"{cod}: disponibili {ref['qty']}, richiesti {qty}")
+    ref['qty'] -= qty
+    ref['scadenze'] = _consuma_fifo(ref['scadenze'], qty)
+    _tocca(ref, now)
+    return "Prelievo"
+
+
+def rettifica(magazzino, cod, qty, now=None):
+    ref = articolo(magazzino, cod)
+    diff = qty - ref['qty']
+    if diff == 0:
+        tipo_azione_log = "Conferma Giacenza"
+    else:
+        ref['qty'] = qty
+        if diff > 0: ref['scadenze'].append({'display': 'MANUALE', 'sort': '9999-12', 'qty': diff})
+        else: ref['scadenze'] = _consuma_fifo(ref['scadenze'], abs(diff))
+        tipo_azione_log = "Rettifica"
+    _tocca(ref, now)
+    return tipo_azione_log
+
+
+def azzera(magazzino, cod, now=None):
+    ref = articolo(magazzino, cod)
+    old_qty = ref['qty']
+    # Reset radicale a zero
+    ref['qty'] = 0
+    ref['scadenze'] = []
+    _tocca(ref, now)
+    return old_qty
@@ -0,0 +1,123 @@
+import pandas as pd
+
+from magazzino.config import MASTER_PATH
+
+COL_MAP = {
+    'Codice_Finale': 'Codice',
+    'Descrizione commerciale': 'Descrizione',
+    'Rgt/Cal/QC/Cons': 'Categoria',
+    '# Kit/Mese': 'Fabbisogno_Kit_Mese_Stimato',
+    'Test TOT MEDI/MESE Aggiustati': 'Test_Mensili_Reali',
+    'KIT': 'Test_per_Scatola',
+    'Conf.to': 'Confezione',
+    'Assay name': 'Assay_Name'
+}
+
+# --- FORZATURE PREVENTIVE UNIFICATE (codice -> kit/mese) ---
+FORZATURE_KIT_MESE = {
+    "8P0852|8P08-52": 2,
+    "9P4922|9P49-22": 4,
+    "7P5320|7P53-20": 2,
+    "06Q1461|06Q14-61": 9,
+    "1R3801|1R38-01": 6,
+    "6P1401|6P14-01": 45,
+    "8P9870|8P98-70": 1,
+    "0L10501|0L10-50": 2,
+    "0L10601|0L10-60": 2,
+    "1R1922|1R19-22": 1,
+}
+
+CODICI_CAL_FORZATI = ["08P6001|08P60-01", "06T7901", "0L10701|0L10-70", "1R1901|1R19-01"]
+
+NOMI_SPECIALI = "VANCOMICINA|BARBITURICI|TRAB|HBsAg Quant|Tireoglobulina|ICT SAMPLE DILUENT|Omocisteina|SECONDARY TUBES|Sample Cups|Reaction Vessels|Maintenance Solutions|Mioglobina|Procalcitonina|MC MCC CALS|Rame|Zinco|Cu-Zn|NSE"
+CODICI_SPECIALI = "8P0852|9P4922|7P5320|09P2820|06Q1461|1R3801|6P1401|8P9870|4V3730|1R1822|08P6001|06T7901|0L10501|0L10601|0L10701|1R1901|1R1922"
+
+
+def clean_custom_values(val):
+    if pd.isna(val): return val
+    s = str(val).strip()
+    if "25-30" in s: return 30
+    if "28" in s and "?" in s: return 4
+    if "12/15" in s: return 15
+    return val
+
+
+def pulisci_master(df):
+    df = df.copy()
+    if 'LN ABBOTT' in df.columns and 'LN ABBOTT AGGIORNATI' in df.columns:
+        df['Codice_Finale'] = df['LN ABBOTT'].fillna(df['LN ABBOTT AGGIORNATI'])
+    else:
+        df['Codice_Finale'] = df.iloc[:, 4]
+
+    df = df.rename(columns={k: v for k, v in COL_MAP.items() if k in df.columns})
+
+    if 'Confezione' not in df.columns:
+        df['Confezione'] = ""
+
+    df = df[df['Descrizione'].notna() & df['Codice'].notna()].copy()
+    df['Codice'] = df['Codice'].astype(str).str.replace('.0', '', regex=False)
+
+    # --- SOSTITUZIONE CODICI OBSOLETI ---
+    df.loc[df['Codice'].str.contains("8P0602|8P06-02", case=False, na=False), 'Codice'] = "06T7901"
+
+    df['Categoria'] = df['Categoria'].fillna('').astype(str)
+    df['Assay_Name'] = df['Assay_Name'].fillna('').astype(str)
+
+    df['Fabbisogno_Kit_Mese_Stimato'] = df['Fabbisogno_Kit_Mese_Stimato'].apply(clean_custom_values)
+
+    for pattern, kit_mese in FORZATURE_KIT_MESE.items():
+        df.loc[df['Codice'].str.contains(pattern, case=False, na=False), 'Fabbisogno_Kit_Mese_Stimato'] = kit_mese
+
+    # FIX CALIBRATORI: Forziamo la categoria a "CAL" e nomi
+    df.loc[df['Codice'].str.contains("08P6001|08P60-01", case=False, na=False), 'Descrizione'] = 'MC MCC CALS'
+    for pattern in CODICI_CAL_FORZATI:
+        df.loc[df['Codice'].str.contains(pattern, case=False, na=False), 'Categoria'] = 'CAL'
+
+    df['Kit_Mese_Numeric'] = pd.to_numeric(df['Fabbisogno_Kit_Mese_Stimato'], errors='coerce')
+
+    for col in ['Test_Mensili_Reali', 'Test_per_Scatola']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+        else:
+            df[col] = 0
+
+    df.loc[df['Codice'].str.contains("09P2820|09P28-20", case=False, na=False), 'Test_Mensili_Reali'] = 1000
+
+    # Kit/mese mancante: lo ricaviamo dai test mensili
+    kit_da_test = df['Test_Mensili_Reali'] / df['Test_per_Scatola'].where(df['Test_per_Scatola'] > 0)
+    manca_kit = df['Kit_Mese_Numeric'].isna() | (df['Kit_Mese_Numeric'] == 0)
+    usa_test = manca_kit & (df['Test_Mensili_Reali'] > 0) & (df['Test_per_Scatola'] > 0)
+    df['Kit_Mese_Numeric'] = df['Kit_Mese_Numeric'].mask(usa_test, kit_da_test).fillna(0)
+
+    # --- REGOLE DI INCLUSIONE NEL MAGAZZINO ---
+    has_valid_consumption = df['Kit_Mese_Numeric'] > 0
+    is_cal = df['Categoria'].str.upper().str.contains("CAL", na=False)
+
+    is_special = df['Descrizione'].str.contains(NOMI_SPECIALI, case=False, na=False) | \
+                 df['Assay_Name'].str.contains(NOMI_SPECIALI, case=False, na=False) | \
+                 df['Codice'].str.contains(CODICI_SPECIALI, case=False, na=False)
+
+    return compatta(df[has_valid_consumption | is_cal | is_special])
+
+
+def compatta(df):
+    # Master compatto: solo le colonne usate, testi ripetuti come categorie e
+    # flag di categoria calcolati una volta sola. Il frame restituito non va
+    # modificato: le viste derivate ne selezionano le colonne senza copiarlo.
+    df = df.reset_index(drop=True)
+    categoria_upper = df['Categoria'].str.upper()
+    return pd.DataFrame({
+        'Codice': df['Codice'].astype('category'),
+        'Descrizione': df['Descrizione'].astype(str),
+        'Categoria': df['Categoria'].astype('category'),
+        'Assay_Name': df['Assay_Name'].astype('category'),
+        'Confezione': df['Confezione'].fillna('').astype(str).astype('category'),
+        'Kit_Mese_Numeric': df['Kit_Mese_Numeric'].astype(float),
+        'is_cal': categoria_upper.str.contains("CAL", na=False),
+        'is_rgt': categoria_upper.str.contains("RGT", na=False),
+        'is_cons': categoria_upper.str.contains("CONS", na=False),
+    }, index=pd.RangeIndex(len(df)))
+
+
+def load_master_data(path=MASTER_PATH):
+    return pulisci_master(pd.read_excel(path, engine='openpyxl'))
@@ -0,0 +1,185 @@
+from bisect import bisect_right, insort
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from magazzino.config import MESI_PREAVVISO_SCADENZA, MIN_SCORTA_CAL
+
+# --- STATI ---
+SCAD_SCADUTO = "☠️ SCADUTO"
+SCAD_PRESTO = "⚠️ PRESTO"
+SCAD_OK = "🟢 OK"
+
+# Lotti senza scadenza (es. RETTIFICA "9999-12") restano sempre validi
+MESE_MAI = 9999 * 12 + 11
+
+COLONNE_LOTTI = ["Stato", "Codice Prodotto", "Prodotto", "Qta", "Scadenza"]
+
+Lotto = namedtuple("Lotto", ["mese", "display", "qty"])
+_LottiSku = namedtuple("_LottiSku", ["lotti", "mesi", "cum"])
+
+
+def mese_intero(sort_key):
+    # "YYYY-MM" -> numero progressivo del mese
+    try:
+        anno, mese = str(sort_key).split("-")[:2]
+        return int(anno) * 12 + int(mese) - 1
+    except (TypeError, ValueError):
+        return MESE_MAI
+
+
+def mese_corrente(now=None):
+    now = now or datetime.now()
+    return now.year * 12 + now.month - 1
+
+
+class IndiceScadenze:
+    # Lotti raggruppati per mese di scadenza (intero) con quantità cumulate
+    # per articolo. "Scaduti", "in scadenza entro N mesi" e "giacenza valida
+    # residua" si ottengono con una ricerca binaria per qualsiasi orizzonte.
+
+    def __init__(self):
+        self._per_sku = {}
+        self._bucket = {}
+        self._mesi = []
+
+    @classmethod
+    def da_magazzino(cls, magazzino):
+        indice = cls()
+        for cod, info in magazzino.items():
+            indice.aggiorna(cod, info.get('scadenze', []))
+        return indice
+
+    def aggiorna(self, cod, scadenze):
+        self._rimuovi(cod)
+        lotti = sorted(
+            (Lotto(mese_intero(b.get('sort')), b.get('display', '-'), b['qty']) for b in scadenze if b['qty'] > 0),
+            key=lambda l: l.mese,
+        )
+        if not lotti:
+            return
+
+        mesi = [l.mese for l in lotti]
+        self._per_sku[cod] = _LottiSku(lotti, mesi, np.cumsum([l.qty for l in lotti]).tolist())
+        for lotto in lotti:
+            if lotto.mese not in self._bucket:
+                self._bucket[lotto.mese] = {}
+                insort(self._mesi, lotto.mese)
+            self._bucket[lotto.mese].setdefault(cod, []).append(lotto)
+
+    def _rimuovi(self, cod):
+        vecchi = self._per_sku.pop(cod, None)
+        if vecchi is None:
+            return
+        for mese in set(vecchi.mesi):
+            bucket = self._bucket[mese]
+            del bucket[cod]
+            if not bucket:
+                del self._bucket[mese]
+                self._mesi.remove(mese)
+
+    # --- INTERROGAZIONI ---
+    def codici(self):
+        return self._per_sku.keys()
+
+    def lotti(self, cod):
+        sku = self._per_sku.get(cod)
+        return sku.lotti if sku else []
+
+    def lotti_fino_a(self, limite):
+        # (codice, lotto) con scadenza <= limite, in ordine cronologico
+        for mese in self._mesi[:bisect_right(self._mesi, limite)]:
+            for cod, lotti in self._bucket[mese].items():
+                for lotto in lotti:
+                    yield cod, lotto
+
+    def tutti(self):
+        return self.lotti_fino_a(MESE_MAI)
+
+    def scaduti(self, oggi):
+        return self.lotti_fino_a(oggi - 1)
+
+    def in_scadenza(self, oggi, mesi=MESI_PREAVVISO_SCADENZA):
+        # Scaduti compresi, come nel tab SCADENZE
+        return self.lotti_fino_a(oggi + mesi)
+
+    def qty_totale(self, cod):
+        sku = self._per_sku.get(cod)
+        return sku.cum[-1] if sku else 0
+
+    def qty_fino_a(self, cod, limite):
+        sku = self._per_sku.get(cod)
+        if not sku:
+            return 0
+        i = bisect_right(sku.mesi, limite)
+        return sku.cum[i - 1] if i else 0
+
+    def qty_valida(self, cod, oggi, mesi=MESI_PREAVVISO_SCADENZA):
+        return self.qty_totale(cod) - self.qty_fino_a(cod, oggi + mesi)
+
+
+# --- REPORT ---
+def anagrafica_da_master(df_master):
+    # codice -> (descrizione, is_cal); a parità di codice vale la prima riga
+    unici = df_master[['Codice', 'Descrizione', 'is_cal']].drop_duplicates('Codice')
+    return {cod: (desc, bool(cal)) for cod, desc, cal in zip(unici['Codice'], unici['Descrizione'], unici['is_cal'])}
+
+
+def _anagrafica(anagrafica, cod):
+    return anagrafica.get(cod, (cod, False))
+
+
+def stato_lotti(mese, oggi, mesi=MESI_PREAVVISO_SCADENZA):
+    return np.select([mese < oggi, mese <= oggi + mesi], [SCAD_SCADUTO, SCAD_PRESTO], SCAD_OK)
+
+
+def _frame_lotti(righe, oggi, mesi):
+    df = pd.DataFrame(righe, columns=["Mese", "Codice Prodotto", "Prodotto", "Qta", "Scadenza"])
+    df.insert(0, "Stato", stato_lotti(df["Mese"], oggi, mesi))
+    return df
+
+
+def tabelle_scadenze(indice, anagrafica, oggi, mesi=MESI_PREAVVISO_SCADENZA, codici=None):
+    # codici: limita le tabelle ai lotti di questi articoli (aggiornamenti parziali)
+    lotti = indice.tutti() if codici is None else ((cod, l) for cod in codici for l in indice.lotti(cod))
+    cal, rgt = [], []
+    for cod, lotto in lotti:
+        nome, is_cal = _anagrafica(anagrafica, cod)
+        (cal if is_cal else rgt).append((lotto.mese, cod, nome, lotto.qty, lotto.display))
+    return _frame_lotti(cal, oggi, mesi), _frame_lotti(rgt, oggi, mesi)
+
+
+def reagenti_in_scadenza(indice, anagrafica, oggi, mesi=MESI_PREAVVISO_SCADENZA):
+    righe = []
+    for cod, lotto in indice.in_scadenza(oggi, mesi):
+        nome, is_cal = _anagrafica(anagrafica, cod)
+        if not is_cal:
+            righe.append((lotto.mese, cod, nome, lotto.qty, lotto.display))
+    return _frame_lotti(righe, oggi, mesi)[COLONNE_LOTTI]
+
+
+def reintegro_calibratori(indice, anagrafica, oggi, mesi=MESI_PREAVVISO_SCADENZA):
+    limite = oggi + mesi
+    in_scadenza = {}
+    for cod, lotto in indice.in_scadenza(oggi, mesi):
+        if _anagrafica(anagrafica, cod)[1]:
+            in_scadenza.setdefault(cod, []).append(lotto.display)
+
+    cal_export_data = []
+    for c_code in sorted(in_scadenza):
+        valid = indice.qty_valida(c_code, oggi, mesi)
+
+        # Se le scorte sane sono meno di 3, calcoliamo quante chiederne
+        if valid < MIN_SCORTA_CAL:
+            cal_export_data.append({
+                'Codice Prodotto': c_code,
+                'Prodotto': _anagrafica(anagrafica, c_code)[0],
+                'Lotti in Scadenza': ", ".join(in_scadenza[c_code]),
+                'Qta Scaduta/In Scadenza': indice.qty_fino_a(c_code, limite),
+                'Giacenza Valida Residua': valid,
+                'Qta da Richiedere (Max 3)': MIN_SCORTA_CAL - valid
+            })
+
+    return pd.DataFrame(cal_export_data)
@@ -0,0 +1,83 @@
+import math
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+# --- PARAMETRI VISUALIZZAZIONE ---
+RIGHE_PER_PAGINA = 50
+MAX_RIGHE_VISIBILI = 15
+ALTEZZA_RIGA = 36
+ALTEZZA_HEADER = 43
+ALTEZZA_MIN = 150
+
+Pagina = namedtuple("Pagina", ["righe", "totale", "pagina", "n_pagine"])
+
+
+def altezza(n_righe, max_righe=MAX_RIGHE_VISIBILI):
+    # Oltre max_righe la tabella scorre internamente invece di allungare la pagina
+    return max(ALTEZZA_MIN, min(n_righe, max_righe) * ALTEZZA_RIGA + ALTEZZA_HEADER)
+
+
+def _contiene(s, term):
+    # Sulle colonne categoriche .str lavora sulle sole categorie
+    if s.dtype != object and not isinstance(s.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+        s = s.astype(str)
+    return s.str.contains(term, case=False, na=False, regex=False)
+
+
+def filtra(df, filtri=None, term=None, colonne_ricerca=()):
+    if filtri:
+        for col, valori in filtri.items():
+            if valori: df = df[df[col].isin(valori)]
+    if term and colonne_ricerca:
+        mask = _contiene(df[colonne_ricerca[0]], term)
+        for col in colonne_ricerca[1:]:
+            mask |= _contiene(df[col], term)
+        df = df[mask]
+    return df
+
+
+def ordina(df, sort_by=None, asc=True):
+    if not sort_by or sort_by not in df.columns:
+        return df
+    return df.sort_values(by=sort_by, ascending=asc, kind='stable')
+
+
+def n_pagine(totale, per_pagina=RIGHE_PER_PAGINA):
+    return max(1, math.ceil(totale / per_pagina))
+
+
+class VistaTabella:
+    # Filtro, ordinamento e paginazione lato server: al frontend arriva solo
+    # la pagina visibile. Le pagine sono memorizzate per versione dei dati,
+    # quindi un rerun senza modifiche non ricalcola nulla.
+
+    def __init__(self, per_pagina=RIGHE_PER_PAGINA, max_cache=16):
+        self.per_pagina = per_pagina
+        self.max_cache = max_cache
+        self._cache = OrderedDict()
+
+    def pagina(self, df, versione, colonne=None, filtri=None, term=None, colonne_ricerca=(), sort_by=None, asc=True, n=1):
+        chiave = (
+            versione, tuple(colonne or ()),
+            tuple(sorted((k, tuple(v)) for k, v in (filtri or {}).items())),
+            term or "", tuple(colonne_ricerca), sort_by, asc, n, self.per_pagina,
+        )
+        if chiave in self._cache:
+            self._cache.move_to_end(chiave)
+            return self._cache[chiave]
+
+        df_view = ordina(filtra(df, filtri, term, colonne_ricerca), sort_by, asc)
+        totale = len(df_view)
+        tot_pagine = n_pagine(totale, self.per_pagina)
+        n = min(max(1, n), tot_pagine)
+        start = (n - 1) * self.per_pagina
+        righe = df_view.iloc[start:start + self.per_pagina]
+        if colonne:
+            righe = righe[colonne]
+
+        risultato = Pagina(righe, totale, n, tot_pagine)
+        self._cache[chiave] = risultato
+        if len(self._cache) > self.max_cache:
+            self._cache.popitem(last=False)
+        return risultato